@@ -4,31 +4,79 @@ SHL Hockey Standings Scraper
 Scrapes the Total standings table from sportstatistik.nu and saves to JSON.
 """
 
+import functools
+import hashlib
 import json
 import os
+import re
 import subprocess
 import sys
 from datetime import datetime
 from typing import List, Dict, Optional, Tuple
 
+import lxml.etree
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]  # Fall back to stdlib json
 
 
 # Constants
 URL = "https://sportstatistik.nu/hockey/shl/tabell"
 OUTPUT_FILE = "standings.json"
+CACHE_FILE = ".fetch_cache.json"  # Validators of the last processed fetch (git-ignored)
 TIMEOUT = 10
 TOTAL_GAMES_IN_SEASON = 52  # SHL regular season
 API_VERSION = "1.0.0"
 
+# <meta charset="..."> or <meta http-equiv="Content-Type" content="...; charset=...">
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+# charset parameter of a Content-Type header
+HEADER_CHARSET_RE = re.compile(r'charset=["\']?([\w-]+)', re.IGNORECASE)
+
+# Raw scraped stat columns, in table order (built by parse_standings, compared by compare_standings)
+STAT_KEYS = ('games_played', 'wins', 'ties', 'losses', 'ot_wins', 'ot_losses',
+             'goals_for', 'goals_against', 'goal_diff', 'points')
+
 
+def _build_session() -> requests.Session:
+    """
+    Create the shared HTTP session.
+
+    Reuses pooled connections across requests and retries connect
+    failures and transient 5xx responses. Read timeouts are not retried,
+    so a hung server costs one TIMEOUT and surfaces as a Timeout.
+    """
+    session = requests.Session()
+    session.headers.update({
+        'User-Agent': f"shl-hockey-scraper/{API_VERSION}",
+        # gzip/deflate, plus br when the brotli package is installed
+        'Accept-Encoding': ACCEPT_ENCODING,
+    })
+    retry = Retry(total=3, read=False, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504),
+                  allowed_methods=frozenset(['GET']))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_SESSION = _build_session()
+
+
+@functools.lru_cache(maxsize=1)
 def get_current_season() -> str:
     """
     Calculate current SHL season based on date.
 
     SHL season runs September to April.
     Returns season in format "YYYY-YYYY" (e.g., "2024-2025").
+    Computed once per process; the season can't change during a run.
     """
     now = datetime.now()
     year = now.year
@@ -42,21 +90,35 @@ def get_current_season() -> str:
         return f"{year - 1}-{year}"
 
 
-def fetch_page(url: str) -> Optional[str]:
+def fetch_page(url: str, validators: Optional[Dict[str, Optional[str]]] = None) -> Optional[requests.Response]:
     """
-    Fetch HTML content from URL.
+    Fetch HTML content from URL, conditionally if validators are known.
 
     Args:
         url: Target URL to fetch
+        validators: Optional dict with 'etag' and 'last_modified' from the previous fetch
 
     Returns:
-        HTML content as string, or None if request fails
+        Response (200 OK or 304 Not Modified), or None if request fails
     """
+    headers = {}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
     try:
         print(f"Fetching SHL standings from {url}...")
-        response = requests.get(url, timeout=TIMEOUT)
+        response = _SESSION.get(url, headers=headers, timeout=TIMEOUT)
         response.raise_for_status()
-        return response.text
+
+        encoding = response.headers.get('Content-Encoding')
+        wire_size = response.headers.get('Content-Length')
+        if encoding and wire_size:
+            print(f"Received {len(response.content)} bytes ({encoding}, {wire_size} bytes transferred)")
+
+        return response
     except requests.exceptions.ConnectionError:
         print("Error: Failed to connect to server", file=sys.stderr)
         return None
@@ -71,29 +133,130 @@ def fetch_page(url: str) -> Optional[str]:
         return None
 
 
-def parse_standings(html: str) -> Optional[List[Dict]]:
+class _TableDone(Exception):
+    """Raised by _FirstTableTarget to stop the parser once the first table has closed."""
+
+
+class _FirstTableTarget:
+    """
+    lxml parser target that collects <td> text of each row in the first <table>.
+
+    libxml2 tokenizes and dispatches start/end/data callbacks without building
+    a tree; everything outside the first table is skipped, and parsing stops
+    at its closing tag. Rows are lists of stripped cell strings (header rows
+    with only <th> cells come out empty).
+    """
+
+    def __init__(self):
+        self.found_table = False
+        self.rows: List[List[str]] = []
+        self._table_depth = 0
+        self._row: Optional[List[str]] = None
+        self._cell: Optional[List[str]] = None
+
+    def _end_cell(self):
+        if self._cell is not None:
+            self._row.append(''.join(self._cell).strip())
+            self._cell = None
+
+    def _end_row(self):
+        self._end_cell()
+        if self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def start(self, tag, attrib):
+        if tag == 'table':
+            self.found_table = True
+            self._table_depth += 1
+        elif self._table_depth != 1:
+            return
+        elif tag == 'tr':
+            self._end_row()
+            self._row = []
+        elif tag == 'td' and self._row is not None:
+            self._end_cell()
+            self._cell = []
+
+    def end(self, tag):
+        if tag == 'table' and self._table_depth:
+            self._table_depth -= 1
+            if self._table_depth == 0:
+                self._end_row()
+                raise _TableDone
+        elif self._table_depth != 1:
+            return
+        elif tag == 'tr':
+            self._end_row()
+        elif tag == 'td':
+            self._end_cell()
+
+    def data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def close(self):
+        # Keep a trailing row if the document ended before </table>
+        self._end_row()
+        return self.rows
+
+
+def decode_html(html: bytes, fallback_encoding: Optional[str] = None) -> str:
+    """
+    Decode page bytes leniently.
+
+    Uses the page's <meta charset>, then fallback_encoding, then UTF-8.
+    Undecodable bytes are replaced rather than failing the whole page.
+
+    Args:
+        html: Raw HTML bytes
+        fallback_encoding: Charset stated in the Content-Type header, if any
+
+    Returns:
+        Decoded HTML string
+    """
+    match = META_CHARSET_RE.search(html, 0, 4096)
+    meta_encoding = match.group(1).decode('ascii') if match else None
+
+    for encoding in (meta_encoding, fallback_encoding):
+        if encoding:
+            try:
+                return html.decode(encoding, errors='replace')
+            except LookupError:
+                continue
+
+    return html.decode('utf-8', errors='replace')
+
+
+def parse_standings(html: bytes, encoding: Optional[str] = None) -> Optional[List[Dict]]:
     """
     Parse the Total standings table from HTML.
 
     Args:
-        html: HTML content containing standings tables
+        html: Raw HTML bytes containing standings tables
+        encoding: Optional charset stated in the Content-Type header, used when
+            the page declares no <meta charset>
 
     Returns:
         List of team standings as dictionaries, or None if parsing fails
     """
     try:
-        soup = BeautifulSoup(html, 'html.parser')
-
-        # Find all tables - we need the first one (Total standings)
-        tables = soup.find_all('table')
-
-        if not tables:
+        # First table on the page is the Total standings. Decoding up front
+        # keeps a stray invalid byte from aborting libxml2's strict decode;
+        # re-encoding as UTF-8 bytes keeps a leading <?xml ... encoding=...?>
+        # declaration legal (lxml rejects it in str input).
+        target = _FirstTableTarget()
+        parser = lxml.etree.HTMLParser(target=target, encoding='utf-8')
+        try:
+            lxml.etree.fromstring(decode_html(html, encoding).encode('utf-8'), parser)
+        except _TableDone:
+            pass
+
+        if not target.found_table:
             print("Error: No tables found on page", file=sys.stderr)
             return None
 
-        # Get first table (Total standings)
-        table = tables[0]
-        rows = table.find_all('tr')
+        rows = target.rows
 
         if len(rows) < 2:
             print("Error: Table has insufficient rows", file=sys.stderr)
@@ -102,9 +265,7 @@ def parse_standings(html: str) -> Optional[List[Dict]]:
         standings = []
 
         # Skip header row (first row), parse data rows
-        for position, row in enumerate(rows[1:], start=1):
-            cells = row.find_all('td')
-
+        for position, cells in enumerate(rows[1:], start=1):
             # Expect 11 columns: team, games_played, wins, ties, losses, ot_wins, ot_losses,
             # goals_for, goals_against, goal_diff, points
             if len(cells) < 11:
@@ -112,29 +273,21 @@ def parse_standings(html: str) -> Optional[List[Dict]]:
                 continue
 
             try:
-                team_data = {
+                team, *nums = cells[:11]
+                stats = tuple(map(int, nums))
+                gp, w, _, _, _, _, gf, _, _, pts = stats
+
+                standings.append({
                     "position": position,
-                    "team": cells[0].get_text(strip=True),
-                    "games_played": int(cells[1].get_text(strip=True)),
-                    "wins": int(cells[2].get_text(strip=True)),
-                    "ties": int(cells[3].get_text(strip=True)),
-                    "losses": int(cells[4].get_text(strip=True)),
-                    "ot_wins": int(cells[5].get_text(strip=True)),
-                    "ot_losses": int(cells[6].get_text(strip=True)),
-                    "goals_for": int(cells[7].get_text(strip=True)),
-                    "goals_against": int(cells[8].get_text(strip=True)),
-                    "goal_diff": int(cells[9].get_text(strip=True)),
-                    "points": int(cells[10].get_text(strip=True))
-                }
-
-                # Add calculated fields
-                gp = team_data["games_played"]
-                team_data["win_percentage"] = round((team_data["wins"] / gp * 100) if gp > 0 else 0.0, 2)
-                team_data["points_per_game"] = round((team_data["points"] / gp) if gp > 0 else 0.0, 2)
-                team_data["goals_per_game"] = round((team_data["goals_for"] / gp) if gp > 0 else 0.0, 2)
-                team_data["games_remaining"] = TOTAL_GAMES_IN_SEASON - gp
-
-                standings.append(team_data)
+                    "team": team,
+                    **dict(zip(STAT_KEYS, stats)),
+                    "win_percentage": round((w / gp * 100) if gp > 0 else 0.0, 2),
+                    "points_per_game": round((pts / gp) if gp > 0 else 0.0, 2),
+                    "goals_per_game": round((gf / gp) if gp > 0 else 0.0, 2),
+                    "games_remaining": TOTAL_GAMES_IN_SEASON - gp,
+                    # Internal: raw stats in STAT_KEYS order, stripped before saving
+                    "_stat_tuple": stats
+                })
             except (ValueError, AttributeError) as e:
                 print(f"Warning: Failed to parse row data: {e}", file=sys.stderr)
                 continue
@@ -151,29 +304,93 @@ def parse_standings(html: str) -> Optional[List[Dict]]:
         return None
 
 
-def load_existing_standings(filename: str) -> Optional[List[Dict]]:
+def load_existing_data(filename: str) -> Optional[Dict]:
     """
-    Load existing standings from JSON file.
+    Load the previously saved JSON envelope.
 
     Args:
         filename: Path to JSON file
 
     Returns:
-        List of standings or None if file doesn't exist/invalid
+        Parsed JSON dict, or None if file doesn't exist/invalid
     """
     if not os.path.exists(filename):
         return None
 
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data.get('standings')
+        with open(filename, 'rb') as f:
+            raw = f.read()
+            return orjson.loads(raw) if orjson is not None else json.loads(raw)
     except (IOError, json.JSONDecodeError) as e:
         print(f"Warning: Could not read existing file: {e}", file=sys.stderr)
         return None
 
 
-def compare_standings(old: List[Dict], new: List[Dict]) -> Tuple[bool, List[str]]:
+def load_cache_validators(filename: str, data: Optional[Dict]) -> Dict[str, Optional[str]]:
+    """
+    Load cache validators of the last processed fetch.
+
+    Args:
+        filename: Path to cache file
+        data: Envelope from load_existing_data
+
+    Returns:
+        Dict with 'etag', 'last_modified' and 'content_sha256', or empty dict
+        if the cache is missing/invalid or there are no saved standings to fall back on
+    """
+    if not data or not data.get('standings') or not os.path.exists(filename):
+        return {}
+
+    try:
+        with open(filename, 'rb') as f:
+            raw = f.read()
+            cache = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except (IOError, json.JSONDecodeError) as e:
+        print(f"Warning: Could not read cache file: {e}", file=sys.stderr)
+        return {}
+
+    return {
+        "etag": cache.get('etag'),
+        "last_modified": cache.get('last_modified'),
+        "content_sha256": cache.get('content_sha256')
+    }
+
+
+def save_cache_validators(filename: str, validators: Dict[str, Optional[str]]) -> None:
+    """
+    Save cache validators of a successfully processed fetch.
+
+    Kept out of standings.json so validator churn never shows up as a data change.
+
+    Args:
+        filename: Path to cache file
+        validators: Dict with 'etag', 'last_modified' and 'content_sha256'
+    """
+    try:
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(validators, f, indent=2)
+    except IOError as e:
+        print(f"Warning: Failed to write cache file: {e}", file=sys.stderr)
+
+
+def get_existing_standings(data: Optional[Dict]) -> Optional[List[Dict]]:
+    """
+    Extract saved standings, prepared for compare_standings.
+
+    Args:
+        data: Envelope from load_existing_data
+
+    Returns:
+        List of standings or None if there are none
+    """
+    standings = data.get('standings') if data else None
+    if standings:
+        for team in standings:
+            team['_stat_tuple'] = tuple(team.get(key) for key in STAT_KEYS)
+    return standings
+
+
+def compare_standings(old: List[Dict], new: List[Dict]) -> Tuple[bool, List[Tuple[str, str]]]:
     """
     Compare old and new standings, report differences.
 
@@ -182,83 +399,91 @@ def compare_standings(old: List[Dict], new: List[Dict]) -> Tuple[bool, List[str]
         new: New standings
 
     Returns:
-        Tuple of (has_changes, list_of_change_messages)
+        Tuple of (has_changes, list of (category, message) pairs), where category
+        is one of "count", "added", "removed", "pos" or "stat"
     """
     changes = []
 
     # Check if team count changed
     if len(old) != len(new):
-        changes.append(f"Team count changed: {len(old)} → {len(new)}")
+        changes.append(("count", f"Team count changed: {len(old)} → {len(new)}"))
         return True, changes
 
-    # Build lookup by team name
+    # Build lookup by team name; whatever is left in remaining_old after
+    # the pass below is the set of removed teams
     old_by_team = {team['team']: team for team in old}
-    new_by_team = {team['team']: team for team in new}
+    remaining_old = set(old_by_team)
+    added = []
 
-    # Check for new/removed teams
-    old_teams = set(old_by_team.keys())
-    new_teams = set(new_by_team.keys())
-
-    if old_teams != new_teams:
-        added = new_teams - old_teams
-        removed = old_teams - new_teams
-        if added:
-            changes.append(f"New teams: {', '.join(added)}")
-        if removed:
-            changes.append(f"Removed teams: {', '.join(removed)}")
-        return True, changes
-
-    # Check position and stat changes
-    for i, new_team in enumerate(new, start=1):
+    # Single pass: detect new teams plus position and stat changes
+    for new_team in new:
         team_name = new_team['team']
-        old_team = old_by_team[team_name]
+        old_team = old_by_team.get(team_name)
+
+        if old_team is None:
+            added.append(team_name)
+            continue
+        remaining_old.discard(team_name)
 
         # Position change
         if old_team['position'] != new_team['position']:
-            changes.append(f"{team_name}: pos {old_team['position']} → {new_team['position']}")
+            changes.append(("pos", f"{team_name}: pos {old_team['position']} → {new_team['position']}"))
+
+        # Stat changes (only compare raw scraped values, not calculated fields).
+        # Unchanged teams are settled by a single tuple comparison.
+        if old_team['_stat_tuple'] == new_team['_stat_tuple']:
+            continue
 
-        # Stat changes (only compare raw scraped values, not calculated fields)
         stat_changes = []
-        for key in ['games_played', 'wins', 'ties', 'losses', 'ot_wins', 'ot_losses',
-                    'goals_for', 'goals_against', 'goal_diff', 'points']:
+        for key in STAT_KEYS:
             if old_team.get(key) != new_team.get(key):
                 stat_changes.append(f"{key} {old_team[key]}→{new_team[key]}")
 
         if stat_changes:
-            changes.append(f"{team_name}: {', '.join(stat_changes)}")
+            changes.append(("stat", f"{team_name}: {', '.join(stat_changes)}"))
+
+    # New/removed teams replace the per-team report
+    if added or remaining_old:
+        changes = []
+        if added:
+            changes.append(("added", f"New teams: {', '.join(added)}"))
+        if remaining_old:
+            changes.append(("removed", f"Removed teams: {', '.join(remaining_old)}"))
+        return True, changes
 
     return len(changes) > 0, changes
 
 
-def generate_commit_message(changes: List[str]) -> str:
+def generate_commit_message(changes: List[Tuple[str, str]]) -> str:
     """
     Generate concise commit message from changes list.
 
     Args:
-        changes: List of change descriptions
+        changes: List of (category, message) pairs from compare_standings
 
     Returns:
         Commit message string
     """
     if len(changes) == 1:
-        return changes[0]
+        return changes[0][1]
 
     # Check for position changes
-    pos_changes = [c for c in changes if ' pos ' in c]
+    pos_changes = [msg for category, msg in changes if category == "pos"]
     if pos_changes:
         return pos_changes[0] if len(pos_changes) == 1 else f"{len(pos_changes)} pos changes"
 
     return f"{len(changes)} teams updated"
 
 
-def save_to_json(data: List[Dict], filename: str, changes: Optional[List[str]] = None) -> bool:
+def save_to_json(data: List[Dict], filename: str,
+                 changes: Optional[List[Tuple[str, str]]] = None) -> bool:
     """
     Save standings data to JSON file.
 
     Args:
         data: List of team standings dictionaries
         filename: Output file path
-        changes: Optional list of changes for this update
+        changes: Optional list of (category, message) changes for this update
 
     Returns:
         True if save successful, False otherwise
@@ -274,12 +499,21 @@ def save_to_json(data: List[Dict], filename: str, changes: Optional[List[str]] =
             "total_games_in_season": TOTAL_GAMES_IN_SEASON,
             "teams_count": len(data),
             "update_message": generate_commit_message(changes) if changes else None,
-            "changes": changes if changes else [],
-            "standings": data
+            "changes": [msg for _, msg in changes] if changes else [],
+            "standings": [{k: v for k, v in team.items() if not k.startswith('_')} for team in data]
         }
 
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(output, f, indent=2, ensure_ascii=False)
+        # orjson always emits UTF-8 (like ensure_ascii=False), same 2-space layout
+        if orjson is not None:
+            payload = orjson.dumps(output, option=orjson.OPT_INDENT_2)
+        else:
+            payload = json.dumps(output, indent=2, ensure_ascii=False).encode('utf-8')
+
+        # Write to a temp file and swap it in so readers never see a partial file
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_filename, filename)
 
         print(f"Saved {len(data)} standings to {filename}")
         return True
@@ -292,12 +526,12 @@ def save_to_json(data: List[Dict], filename: str, changes: Optional[List[str]] =
         return False
 
 
-def git_commit_and_push(changes: List[str]) -> bool:
+def git_commit_and_push(changes: List[Tuple[str, str]]) -> bool:
     """
     Commit and push standings.json changes to git.
 
     Args:
-        changes: List of change descriptions from compare_standings
+        changes: List of (category, message) pairs from compare_standings
 
     Returns:
         True if successful, False otherwise
@@ -305,12 +539,17 @@ def git_commit_and_push(changes: List[str]) -> bool:
     try:
         msg = generate_commit_message(changes)
 
-        # Add and commit
-        subprocess.run(['git', 'add', OUTPUT_FILE], check=True, capture_output=True)
-        subprocess.run(['git', 'commit', '-m', msg], check=True, capture_output=True)
+        # Stage and commit in one process; --only limits the commit to standings.json
+        commit = ['git', 'commit', '-m', msg, '--only', OUTPUT_FILE]
+        result = subprocess.run(commit, capture_output=True, text=True)
+        if result.returncode != 0:
+            # --only needs a tracked path; after a fresh deploy the file is
+            # still untracked, so add it once and retry
+            subprocess.run(['git', 'add', OUTPUT_FILE], check=True, capture_output=True, text=True)
+            subprocess.run(commit, check=True, capture_output=True, text=True)
 
         # Push to remote
-        result = subprocess.run(['git', 'push'], check=True, capture_output=True, text=True)
+        subprocess.run(['git', 'push'], check=True, capture_output=True, text=True)
         print(f"Pushed to remote: {msg}")
         return True
 
@@ -326,31 +565,58 @@ def git_commit_and_push(changes: List[str]) -> bool:
 
 def main():
     """Main execution function."""
-    # Load existing standings
-    existing = load_existing_standings(OUTPUT_FILE)
+    # Load previous output; only the cache validators are needed before fetching
+    existing_data = load_existing_data(OUTPUT_FILE)
+    validators = load_cache_validators(CACHE_FILE, existing_data)
 
-    # Fetch page
-    html = fetch_page(URL)
-    if html is None:
+    # 1. Conditional GET using validators from the last processed fetch
+    response = fetch_page(URL, validators)
+    if response is None:
         sys.exit(1)
 
-    # Parse standings
-    standings = parse_standings(html)
+    if response.status_code == 304:
+        print("Page not modified since last fetch - standings.json not modified")
+        print("Done!")
+        return
+
+    # 2. Byte-identical body (server ignored the validators)
+    # Hand the raw bytes to the parser; response.text would run charset detection first
+    html = response.content
+    content_sha256 = hashlib.sha256(html).hexdigest()
+
+    if content_sha256 == validators.get('content_sha256'):
+        print("Page content unchanged since last fetch - standings.json not modified")
+        print("Done!")
+        return
+
+    validators = {
+        "etag": response.headers.get('ETag'),
+        "last_modified": response.headers.get('Last-Modified'),
+        "content_sha256": content_sha256
+    }
+
+    # 3. Page changed: parse and diff against the saved standings
+    # Not response.encoding: requests reports ISO-8859-1 for text/html without
+    # a charset, which would shadow the UTF-8 default in decode_html()
+    charset = HEADER_CHARSET_RE.search(response.headers.get('Content-Type', ''))
+    standings = parse_standings(html, charset.group(1) if charset else None)
     if standings is None:
         sys.exit(1)
 
-    # Compare with existing
+    existing = get_existing_standings(existing_data)
     if existing is not None:
         has_changes, changes = compare_standings(existing, standings)
 
         if not has_changes:
+            # Page bytes changed but the table didn't; remember this version
+            save_cache_validators(CACHE_FILE, validators)
             print("No changes detected - standings.json not modified")
             print("Done!")
             return
 
         # Report changes
         print(f"\n{len(changes)} change(s) detected:")
-        for change in changes:
+        for _, change in changes:
             print(f"  - {change}")
         print()
 
@@ -369,6 +635,8 @@ def main():
         if not success:
             sys.exit(1)
 
+    save_cache_validators(CACHE_FILE, validators)
+
     print("Done!")
 
 